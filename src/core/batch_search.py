@@ -0,0 +1,112 @@
+"""
+Batched FAISS Search
+====================
+Coalesces similarity searches from concurrent requests into one FAISS call.
+FAISS searches a (B, d) query matrix with a single BLAS pass, so a handful of
+in-flight queries cost about as much as one.
+"""
+
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Dict, List, Tuple
+
+import faiss
+import numpy as np
+from langchain_community.vectorstores.utils import maximal_marginal_relevance
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+
+class BatchSearcher:
+    """Background worker that batches index.search() calls from concurrent threads"""
+
+    def __init__(self, max_batch: int = 32, max_wait_ms: float = 2.0, timeout: float = 30.0):
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.timeout = timeout
+        self._pending = queue.Queue()
+        self._worker = threading.Thread(target=self._run, name="faiss-batch-search", daemon=True)
+        self._worker.start()
+
+    def search(self, index: Any, vector: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Search a single query vector, blocking until its batch has been searched"""
+        vector = np.asarray(vector, dtype=np.float32).reshape(-1)
+        if not self._worker.is_alive():
+            # Nothing would ever resolve a queued request; search on this thread instead
+            return index.search(vector.reshape(1, -1), k)
+
+        future = Future()
+        self._pending.put((index, vector, k, future))
+        # Raises concurrent.futures.TimeoutError rather than blocking the request forever
+        return future.result(timeout=self.timeout)
+
+    def _run(self):
+        """Collect queued queries until the batch is full or the wait window closes"""
+        while True:
+            batch = [self._pending.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self._pending.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            self._search_batch(batch)
+
+    def _search_batch(self, batch: List[tuple]):
+        """Run one index.search() per index in the batch and resolve each future"""
+        # Group by index object so a reload mid-batch never mixes index versions
+        groups: Dict[int, List[tuple]] = {}
+        for item in batch:
+            groups.setdefault(id(item[0]), []).append(item)
+
+        for items in groups.values():
+            index = items[0][0]
+            k = max(item[2] for item in items)
+            try:
+                distances, indices = index.search(np.stack([item[1] for item in items]), k)
+            except Exception as e:
+                for item in items:
+                    item[3].set_exception(e)
+                continue
+
+            # Results are sorted by distance, so a smaller k is a prefix of the row
+            for row, (_, _, item_k, future) in enumerate(items):
+                future.set_result((distances[row:row + 1, :item_k], indices[row:row + 1, :item_k]))
+
+
+class BatchedMMRRetriever(BaseRetriever):
+    """MMR retriever over a LangChain FAISS store that searches through a BatchSearcher"""
+
+    vectorstore: Any
+    searcher: Any
+    k: int = 4
+    fetch_k: int = 20
+    lambda_mult: float = 0.5
+    search_index: Any = None  # e.g. a GPU copy of vectorstore.index; candidates are still read from the CPU index
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        store = self.vectorstore
+        embedding = np.array([store._embed_query(query)], dtype=np.float32)
+        if store._normalize_L2:
+            faiss.normalize_L2(embedding)
+
+        index = self.search_index if self.search_index is not None else store.index
+        _, indices = self.searcher.search(index, embedding, self.fetch_k)
+        hits = [int(i) for i in indices[0] if i != -1]
+        if not hits:
+            return []
+
+        # Same selection as FAISS.max_marginal_relevance_search_by_vector
+        candidates = [store.index.reconstruct(i) for i in hits]
+        selected = maximal_marginal_relevance(
+            embedding, candidates, k=self.k, lambda_mult=self.lambda_mult
+        )
+        return [store.docstore.search(store.index_to_docstore_id[hits[i]]) for i in selected]
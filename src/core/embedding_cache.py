@@ -0,0 +1,93 @@
+"""
+Disk Embedding Cache
+====================
+Persists query embeddings as .npy files keyed by the SHA-256 of the query text,
+so a repeated question skips the embeddings API round-trip in every process.
+The least recently used files are deleted once the cache exceeds max_entries.
+"""
+
+import hashlib
+import os
+import tempfile
+from pathlib import Path
+from typing import List
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+
+class DiskCachedEmbeddings(Embeddings):
+    """Wraps an Embeddings model and caches embed_query() results on disk"""
+
+    # Misses between scans of the cache directory for eviction
+    PRUNE_INTERVAL = 100
+
+    def __init__(self, underlying: Embeddings, cache_dir: Path, max_entries: int = 10000):
+        self.underlying = underlying
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max_entries
+        self._writes = 0
+        # Keep vectors from different embedding models apart
+        self.namespace = str(getattr(underlying, "model", type(underlying).__name__))
+        self._prune()
+
+    def _cache_path(self, text: str) -> Path:
+        digest = hashlib.sha256(f"{self.namespace}\0{text}".encode("utf-8")).hexdigest()
+        return self.cache_dir / f"{digest}.npy"
+
+    def embed_query(self, text: str) -> List[float]:
+        """Return the cached vector for text, embedding and storing it on a miss"""
+        path = self._cache_path(text)
+        try:
+            vector = np.load(path)
+            os.utime(path)  # Mark as recently used for eviction
+            return vector.tolist()
+        except (OSError, ValueError):
+            pass
+
+        # Stored as float32, so return the same rounding on a miss as on later hits
+        vector = np.asarray(self.underlying.embed_query(text), dtype=np.float32)
+        tmp_name = None
+        try:
+            # Write then rename so concurrent workers never read a partial file
+            fd, tmp_name = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                np.save(f, vector)
+            os.replace(tmp_name, path)
+        except OSError as e:
+            print(f"⚠️ Could not cache query embedding: {e}")
+            if tmp_name is not None:
+                try:
+                    os.unlink(tmp_name)
+                except OSError:
+                    pass  # Never created or already renamed
+
+        self._writes += 1
+        if self._writes % self.PRUNE_INTERVAL == 0:
+            self._prune()
+        return vector.tolist()
+
+    def _prune(self):
+        """Delete the least recently used files beyond max_entries"""
+        entries = []
+        try:
+            for entry in os.scandir(self.cache_dir):
+                if entry.name.endswith(".npy"):
+                    entries.append((entry.stat().st_mtime, entry.path))
+        except OSError:
+            return
+
+        excess = len(entries) - self.max_entries
+        if excess <= 0:
+            return
+        entries.sort()
+        for _, path in entries[:excess]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass  # Already evicted by another worker
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Document chunks are embedded once at ingestion, so they bypass the cache"""
+        return self.underlying.embed_documents(texts)
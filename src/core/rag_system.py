@@ -7,6 +7,9 @@ Enhanced with query optimization, validation, and quality improvements.
 """
 
 import os
+import atexit
+import importlib
+import importlib.util
 import json
 import asyncio
 import pickle
@@ -15,9 +18,13 @@ import time
 from typing import List, Dict, Optional, Tuple, Any
 from pathlib import Path
 import shutil
+import tempfile
 from dataclasses import dataclass
 import threading
+import weakref
+import platform
 from collections import OrderedDict
+import numpy as np
 
 # Import LlamaParse with fallback
 try:
@@ -67,16 +74,16 @@ except ImportError:
     REDIS_AVAILABLE = False
     print("⚠️ Redis not available. Install with: pip install redis")
 
-# Import Unstructured with fallback
-try:
-    from langchain_community.document_loaders import UnstructuredFileLoader
-    UNSTRUCTURED_AVAILABLE = True
-except ImportError:
-    UNSTRUCTURED_AVAILABLE = False
+# Check for Unstructured (loader imported when a fallback needs it)
+UNSTRUCTURED_AVAILABLE = importlib.util.find_spec("unstructured") is not None
+if not UNSTRUCTURED_AVAILABLE:
     print("⚠️ Unstructured not available. Install with: pip install unstructured")
 
+# Optional scikit-learn for keyword IDF ranking (imported on first use)
+SKLEARN_AVAILABLE = importlib.util.find_spec("sklearn") is not None
+
+import faiss
 from langchain_community.vectorstores import FAISS
-from langchain_openai import OpenAIEmbeddings, ChatOpenAI
 try:
     from langchain_huggingface import HuggingFaceEmbeddings
 except ImportError:
@@ -86,6 +93,9 @@ from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_core.documents import Document
 from langchain.schema import HumanMessage, SystemMessage
 
+from .batch_search import BatchSearcher, BatchedMMRRetriever
+from .embedding_cache import DiskCachedEmbeddings
+
 # Import semantic chunking
 try:
     from .semantic_splitter import SmartChunkingStrategy
@@ -96,7 +106,95 @@ except ImportError:
 
 from dotenv import load_dotenv
 
-@dataclass
+# Heavy client libraries are imported on first use rather than at module import
+_LAZY_IMPORTS = {
+    "OpenAIEmbeddings": "langchain_openai",
+    "ChatOpenAI": "langchain_openai",
+    "UnstructuredFileLoader": "langchain_community.document_loaders",
+}
+
+def __getattr__(name):
+    """Resolve lazily imported names as module attributes (PEP 562)"""
+    module_name = _LAZY_IMPORTS.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(module_name), name)
+    globals()[name] = value
+    return value
+
+_shared_http_client = None
+_shared_http_client_lock = threading.Lock()
+
+def _get_shared_http_client():
+    """Return the process-wide pooled HTTP client shared by the OpenAI embeddings and chat models"""
+    global _shared_http_client
+    with _shared_http_client_lock:
+        if _shared_http_client is None:
+            import httpx
+            _shared_http_client = httpx.Client(
+                # HTTP/2 multiplexes concurrent calls over one connection when h2 is installed
+                http2=importlib.util.find_spec("h2") is not None,
+                limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+                timeout=30.0,
+                follow_redirects=True,
+            )
+            atexit.register(_shared_http_client.close)
+        return _shared_http_client
+
+def _configure_faiss():
+    """Apply FAISS_OMP_THREADS and warn when FAISS was loaded without SIMD kernels"""
+    omp_threads = os.getenv("FAISS_OMP_THREADS")
+    if omp_threads:
+        try:
+            faiss.omp_set_num_threads(int(omp_threads))
+        except ValueError:
+            print(f"⚠️ Ignoring invalid FAISS_OMP_THREADS value: {omp_threads}")
+    
+    # faiss-cpu>=1.7.3 wheels pick the AVX2/AVX-512 build at import when the CPU supports it
+    if platform.machine().lower() in ("x86_64", "amd64") and hasattr(faiss, "get_compile_options"):
+        compile_options = faiss.get_compile_options()
+        if "AVX2" not in compile_options and "AVX512" not in compile_options:
+            print(f"⚠️ FAISS loaded without AVX2/AVX-512 kernels ({compile_options.strip() or 'generic'}). "
+                  "Upgrade with: pip install -U 'faiss-cpu>=1.8.0'")
+
+_configure_faiss()
+
+# Query analysis patterns and word lists, compiled once at import
+_THAI_CHAR_RE = re.compile(r'[\u0E00-\u0E7F]')
+_THAI_WORD_CLEAN_RE = re.compile(r'[^\u0E00-\u0E7F\u0E80-\u0EFFa-zA-Z0-9]')
+_ENGLISH_WORD_RE = re.compile(r'\b[a-zA-Z]+\b')
+_INVALID_QUERY_CHARS_RE = re.compile(r'[<>{}\[\]\\]')
+_EXCESSIVE_WHITESPACE_RE = re.compile(r'\s{5,}')
+_WHITESPACE_RE = re.compile(r'\s+')
+
+_THAI_STOP_WORDS = frozenset([
+    "คือ", "อะไร", "อย่างไร", "ของ", "ใน", "ที่", "และ", "หรือ", "แต่", "กับ", "โดย", "มี", "เป็น", "จะ", "ได้", "ให้",
+    "จาก", "ถึง", "นี้", "นั้น", "ไหน", "ใคร", "เมื่อ", "ทำไม", "เท่าไร", "กี่", "หลาย", "มาก", "น้อย", "ดี", "ไม่", "ใช่",
+    "ใช่ไหม", "หรือไม่"
+])
+_ENGLISH_STOP_WORDS = frozenset([
+    "what", "is", "the", "a", "an", "and", "or", "but", "in", "on", "at", "to", "for", "of", "with", "by", "are", "you",
+    "your", "this", "that", "these", "those", "have", "has", "had", "do", "does", "did", "will", "would", "could",
+    "should", "can", "may", "might", "must"
+])
+# Common words (English and Thai) that naturally repeat and are skipped by the repetition check
+_REPEATABLE_QUERY_WORDS = frozenset([
+    'the', 'a', 'an', 'and', 'or', 'of', 'to', 'for', 'in', 'on', 'with', 'by', 'from', 'at', 'as', 'is', 'are', 'was',
+    'were', 'be', 'been', 'have', 'has', 'had', 'do', 'does', 'did', 'will', 'would', 'could', 'should', 'can', 'may',
+    'might', 'must',
+    'ครับ', 'ค่ะ', 'คุณ', 'ของ', 'ที่', 'และ', 'หรือ', 'เป็น', 'ใน', 'กับ', 'จาก', 'ไป', 'มา', 'ได้', 'ให้', 'แล้ว', 'เพื่อ',
+    'ว่า', 'ก็', 'ไว้', 'อยู่', 'ซึ่ง', 'ไม่', 'มี', 'ประกัน'
+])
+
+# Query confidence by [query length][keyword count]: min(len/50, 1.0) + min(kw/5, 0.3),
+# capped at 1.0. Both terms saturate (length at 50 chars, keywords at 2), so the
+# table covers every input.
+_CONFIDENCE_TABLE = tuple(
+    tuple(min(min(length / 50, 1.0) + min(kw / 5, 0.3), 1.0) for kw in range(3))
+    for length in range(51)
+)
+
+@dataclass(slots=True, frozen=True)
 class QueryAnalysis:
     """Query analysis result for quality enhancement"""
     original_query: str
@@ -107,7 +205,7 @@ class QueryAnalysis:
     confidence: float
     suggestions: List[str]
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class RetrievalMetrics:
     """Retrieval performance metrics"""
     query_time: float
@@ -118,6 +216,81 @@ class RetrievalMetrics:
     relevance_score: float
     confidence_score: float
 
+# One row per query in the metrics ring buffer, columns mirror RetrievalMetrics
+_METRICS_DTYPE = np.dtype([
+    ("query_time", "f4"),
+    ("retrieval_time", "f4"),
+    ("generation_time", "f4"),
+    ("total_tokens", "i4"),
+    ("source_count", "i2"),
+    ("relevance_score", "f4"),
+    ("confidence_score", "f4"),
+])
+
+class QueryCache:
+    """Thread-safe LRU cache for query results with per-entry TTL"""
+
+    def __init__(self, max_size: int = 100, ttl: float = 300.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: OrderedDict = OrderedDict()  # key -> (value, expires_at)
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[Dict]:
+        """Get a live entry, moving it to the most-recently-used end"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                self.evictions += 1
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: str, value: Dict):
+        """Store an entry, evicting the least recently used one if full"""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+            elif len(self._entries) >= self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+
+    def clear(self):
+        """Drop all entries (e.g. after the index changes)"""
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get_stats(self) -> Dict:
+        """Get hit/miss/eviction counters"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0
+            }
+
 # Optional web search
 try:
     from tavily import TavilyClient
@@ -175,11 +348,32 @@ class RAGSystem:
         
         # Cache for loaded indexes to avoid repeated file I/O
         self._index_cache = None  # Single cached index instead of dict
-        self._index_cache_time = 0
+        self._index_cache_time = 0  # mtime of index.faiss the cache was loaded from
+        # Held across load_index(writable=True) -> modify -> save_index so writers don't lose updates
+        self.index_write_lock = threading.RLock()
+        self._keyword_idf = None  # (term -> IDF weight, weight for unseen terms) for the cached index
+        self._keyword_idf_source = None  # weakref to the vectorstore the weights were fitted on
+        self._keyword_idf_lock = threading.Lock()
         self._initialized = False
         
-        self._query_lru_cache = OrderedDict()
+        # Coalesce concurrent retrievals into batched FAISS searches (opt-in)
+        self._batch_searcher = None
+        if os.getenv("FAISS_BATCH_SEARCH", "").lower() in ("1", "true", "yes"):
+            self._batch_searcher = BatchSearcher()
+        
+        # Search a GPU copy of the cached index from the batch worker thread (opt-in)
+        self._gpu_resources = None
+        self._gpu_index = None  # (vectorstore, GPU index) for the cached read-only index
+        if os.getenv("FAISS_USE_GPU", "").lower() in ("1", "true", "yes"):
+            if not self._batch_searcher:
+                print("⚠️ FAISS_USE_GPU requires FAISS_BATCH_SEARCH=1; searching on CPU")
+            elif not hasattr(faiss, "StandardGpuResources") or faiss.get_num_gpus() == 0:
+                print("⚠️ FAISS_USE_GPU set but no CUDA device or faiss-gpu build found; searching on CPU")
+            else:
+                self._gpu_resources = faiss.StandardGpuResources()
+        
         self._max_cache_size = 100  # Limit cache size to prevent memory leaks
+        self._query_lru_cache = QueryCache(max_size=self._max_cache_size, ttl=300.0)
         
         # Disable LlamaParse for performance optimization
         self.llama_parser = None
@@ -187,7 +381,9 @@ class RAGSystem:
         self._llama_lock = threading.Lock()
         
         # Quality enhancement components
-        self.performance_metrics = []
+        self._metrics = np.zeros(1000, dtype=_METRICS_DTYPE)  # Ring buffer of recent query metrics
+        self._metrics_count = 0  # Total queries recorded; next row is _metrics_count % len(_metrics)
+        self._metrics_lock = threading.Lock()
         self.quality_thresholds = {
             "min_confidence": 0.3,
             "min_relevance": 0.5,
@@ -212,15 +408,26 @@ class RAGSystem:
             return
         
         try:
+            from langchain_openai import OpenAIEmbeddings, ChatOpenAI
+            
+            # Reuse one connection pool (and its TLS sessions) for all OpenAI calls
+            http_client = _get_shared_http_client()
+            
             # Initialize OpenAI embeddings
             self.embeddings = OpenAIEmbeddings(
                 model="text-embedding-3-small",
                 show_progress_bar=False,
                 max_retries=2,  # Reduced retries for faster failure
                 request_timeout=30,  # Add timeout
+                http_client=http_client,
             )
             print("🔗 Using OpenAI embeddings (text-embedding-3-small)")
             
+            # Reuse query embeddings across requests and processes (opt-in)
+            if os.getenv("EMBEDDING_DISK_CACHE", "").lower() in ("1", "true", "yes"):
+                self.embeddings = DiskCachedEmbeddings(self.embeddings, self.base_storage_dir / "emb_cache")
+                print("💾 Query embedding disk cache enabled")
+            
             # Initialize primary LLM with optimized settings
             self.llm = ChatOpenAI(
                 model="gpt-4o-mini",  # Fast and efficient model
@@ -228,6 +435,7 @@ class RAGSystem:
                 max_retries=1,  # Single retry for speed
                 max_tokens=1000,  # Reduced tokens for faster response
                 request_timeout=20,  # Shorter timeout
+                http_client=http_client,
             )
             
             # Skip fallback initialization for performance
@@ -441,34 +649,37 @@ class RAGSystem:
     
     def _get_from_lru_cache(self, key: str) -> Optional[Dict]:
         """Get item from LRU cache, moving it to end if found"""
-        if key in self._query_lru_cache:
-            value = self._query_lru_cache.pop(key)
-            self._query_lru_cache[key] = value
-            return value
-        return None
+        return self._query_lru_cache.get(key)
     
     def _set_in_lru_cache(self, key: str, value: Dict):
         """Set item in LRU cache, evicting oldest if necessary"""
-        if key in self._query_lru_cache:
-            self._query_lru_cache.pop(key)
-        elif len(self._query_lru_cache) >= self._max_cache_size:
-            self._query_lru_cache.popitem(last=False)
-        
-        self._query_lru_cache[key] = value
+        self._query_lru_cache.set(key, value)
     
     def get_storage_path(self) -> Path:
         """Get storage directory path"""
         return self.base_storage_dir
     
-    def load_index(self) -> Optional[FAISS]:
+    def load_index(self, writable: bool = False) -> Optional[FAISS]:
         """
         Load FAISS index
         
+        Args:
+            writable: Load a private copy from disk for callers that modify the
+                index (ingest, delete) instead of the shared cached instance
+        
         Returns:
             FAISS vectorstore or None if doesn't exist
         """
         index_path = self.base_storage_dir / "faiss_index"
         
+        # Reuse the cached index while the file on disk is unchanged
+        if not writable and self._index_cache is not None:
+            try:
+                if (index_path / "index.faiss").stat().st_mtime == self._index_cache_time:
+                    return self._index_cache
+            except OSError:
+                pass
+        
         print(f"🔍 Checking if index path exists: {index_path}")
         if not index_path.exists():
             print(f"❌ Index path does not exist: {index_path}")
@@ -514,15 +725,24 @@ class RAGSystem:
             print(f"📁 Attempting to load FAISS index...")
             start_time = time.time()
             
-            vectorstore = FAISS.load_local(
-                str(index_path),
-                self.embeddings,
-                allow_dangerous_deserialization=True
-            )
+            if not writable and self._mmap_index_enabled():
+                vectorstore = self._load_index_mmap(index_path)
+            else:
+                vectorstore = FAISS.load_local(
+                    str(index_path),
+                    self.embeddings,
+                    allow_dangerous_deserialization=True
+                )
             
             load_time = time.time() - start_time
             print(f"✅ Successfully loaded FAISS index in {load_time:.2f} seconds")
             print(f"✅ Loaded FAISS index with {vectorstore.index.ntotal} vectors")
+            
+            if not writable:
+                self._index_cache = vectorstore
+                self._index_cache_time = faiss_index_file.stat().st_mtime
+                if self._gpu_resources is not None:
+                    self._gpu_index = self._index_to_gpu(vectorstore)
             return vectorstore
             
         except Exception as e:
@@ -532,6 +752,47 @@ class RAGSystem:
             print(f"❌ Full traceback: {traceback.format_exc()}")
             return None
     
+    def _index_to_gpu(self, vectorstore: FAISS) -> Optional[Tuple[FAISS, Any]]:
+        """Copy the index to GPU 0, or return None if its type has no GPU implementation"""
+        try:
+            gpu_index = faiss.index_cpu_to_gpu(self._gpu_resources, 0, vectorstore.index)
+        except RuntimeError as e:
+            print(f"⚠️ Keeping FAISS index on CPU: {e}")
+            return None
+        print(f"🚀 Copied FAISS index to GPU 0 for batched search")
+        return vectorstore, gpu_index
+    
+    def _mmap_index_enabled(self) -> bool:
+        """Whether read-only index loads should memory-map index.faiss (FAISS_MMAP_INDEX)"""
+        return os.getenv("FAISS_MMAP_INDEX", "").lower() in ("1", "true", "yes")
+    
+    def _load_index_mmap(self, index_path: Path) -> FAISS:
+        """
+        Load the FAISS index memory-mapped and read-only
+        
+        The vectors stay in the page cache (shared between worker processes)
+        instead of being copied into each process. The result must never be
+        modified: FAISS aborts the process when adding to a mapped index.
+        """
+        flags = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+        # Flat-code indexes (flat, fp16, pq) are only mapped with IO_FLAG_MMAP_IFC
+        if hasattr(faiss, "IO_FLAG_MMAP_IFC"):
+            flags |= faiss.IO_FLAG_MMAP_IFC
+        else:
+            print(f"⚠️ FAISS {faiss.__version__} cannot memory-map flat indexes; FAISS_MMAP_INDEX "
+                  "loads a private in-memory copy instead. Upgrade with: pip install -U faiss-cpu")
+        index = faiss.read_index(str(index_path / "index.faiss"), flags)
+        
+        with open(index_path / "index.pkl", "rb") as f:
+            docstore, index_to_docstore_id = pickle.load(f)
+        
+        return FAISS(
+            embedding_function=self.embeddings,
+            index=index,
+            docstore=docstore,
+            index_to_docstore_id=index_to_docstore_id
+        )
+    
     def save_index(self, vectorstore: FAISS):
         """
         Save FAISS index and update cache
@@ -540,19 +801,78 @@ class RAGSystem:
             vectorstore: FAISS vectorstore to save
         """
         index_path = self.base_storage_dir / "faiss_index"
+        tmp_path = None
+        
+        # One writer at a time, so index.pkl and index.faiss come from the same save
+        with self.index_write_lock:
+            try:
+                print(f"💾 Saving FAISS index...")
+                # Write to a temp dir of this save's own and swap the files in, so
+                # processes that have index.faiss open or mapped keep reading the
+                # previous file intact
+                self.base_storage_dir.mkdir(parents=True, exist_ok=True)
+                tmp_path = Path(tempfile.mkdtemp(dir=self.base_storage_dir, prefix="faiss_index."))
+                vectorstore.save_local(str(tmp_path))
+                index_path.mkdir(parents=True, exist_ok=True)
+                for filename in ("index.pkl", "index.faiss"):
+                    os.replace(tmp_path / filename, index_path / filename)
+                
+                # Update cache; readers holding the previous instance finish on it.
+                # With mmap or GPU enabled the next read reloads from the new file instead.
+                reload = self._mmap_index_enabled() or self._gpu_resources is not None
+                self._index_cache = None if reload else vectorstore
+                self._index_cache_time = (index_path / "index.faiss").stat().st_mtime
+                
+                # Cached answers were generated from the previous index contents
+                self._query_lru_cache.clear()
+                
+                print(f"✅ Saved FAISS index to {index_path}")
+            except Exception as e:
+                print(f"❌ Failed to save FAISS index: {e}")
+                raise
+            finally:
+                if tmp_path is not None:
+                    shutil.rmtree(tmp_path, ignore_errors=True)
+    
+    def _get_keyword_idf(self) -> Optional[Tuple[Dict[str, float], float]]:
+        """
+        IDF weights over the chunks of the currently cached index
+        
+        Fitted on first use after the cached index changes, never during
+        ingestion. Returns None without scikit-learn, before an index has been
+        loaded, or when fitting fails.
+        """
+        vectorstore = self._index_cache
+        if not SKLEARN_AVAILABLE or vectorstore is None:
+            return None
+        
+        with self._keyword_idf_lock:
+            source = self._keyword_idf_source
+            if source is None or source() is not vectorstore:
+                self._keyword_idf = self._fit_keyword_idf(vectorstore)
+                self._keyword_idf_source = weakref.ref(vectorstore)
+            return self._keyword_idf
+    
+    def _fit_keyword_idf(self, vectorstore: FAISS) -> Optional[Tuple[Dict[str, float], float]]:
+        """Fit term IDF weights on the indexed chunks; None if there is nothing to fit"""
+        texts = [doc.page_content for doc in vectorstore.docstore._dict.values()]
+        if not texts:
+            return None
         
         try:
-            print(f"💾 Saving FAISS index...")
-            vectorstore.save_local(str(index_path))
-            
-            # Update cache
-            self._index_cache = vectorstore
-            self._index_cache_time = time.time()
+            from sklearn.feature_extraction.text import TfidfVectorizer
             
-            print(f"✅ Saved FAISS index to {index_path}")
+            # Same token classes _extract_keywords produces: Thai runs and Latin words
+            vectorizer = TfidfVectorizer(token_pattern=r"[\u0E00-\u0E7Fa-zA-Z0-9]{2,}", max_features=50000)
+            vectorizer.fit(texts)
         except Exception as e:
-            print(f"❌ Failed to save FAISS index: {e}")
-            raise
+            # Keyword ranking is best-effort; keep query order instead
+            print(f"⚠️ Skipped keyword IDF weights: {e}")
+            return None
+        
+        idf = dict(zip(vectorizer.get_feature_names_out().tolist(), vectorizer.idf_.tolist()))
+        # Terms the corpus never saw rank as the rarest
+        return idf, max(idf.values(), default=0.0)
     
     def ingest_file(self, file_path: str, metadata: Optional[Dict] = None) -> Dict:
         """
@@ -608,21 +928,22 @@ class RAGSystem:
                 texts = self.text_splitter.split_documents(documents)
                 print(f"✂️ Created {len(texts)} chunks using standard chunking")
             
-            # Load existing index or create new one
-            existing_vectorstore = self.load_index()
-            
-            if existing_vectorstore is None:
-                # Create new vectorstore
-                print(f"🆕 Creating new vectorstore")
-                vectorstore = FAISS.from_documents(texts, self.embeddings)
-            else:
-                # Add to existing vectorstore
-                print(f"📚 Adding to existing vectorstore")
-                vectorstore = existing_vectorstore
-                vectorstore.add_documents(texts)
-            
-            # Save the updated vectorstore
-            self.save_index(vectorstore)
+            with self.index_write_lock:
+                # Load existing index or create new one
+                existing_vectorstore = self.load_index(writable=True)
+                
+                if existing_vectorstore is None:
+                    # Create new vectorstore
+                    print(f"🆕 Creating new vectorstore")
+                    vectorstore = self._create_vectorstore(texts)
+                else:
+                    # Add to existing vectorstore
+                    print(f"📚 Adding to existing vectorstore")
+                    vectorstore = existing_vectorstore
+                    vectorstore.add_documents(texts)
+                
+                # Save the updated vectorstore
+                self.save_index(vectorstore)
             
             # Calculate total characters
             total_chars = sum(len(doc.page_content) for doc in documents)
@@ -648,6 +969,53 @@ class RAGSystem:
             print(f"❌ Ingestion failed: {e}")
             return error_result
     
+    def _create_vectorstore(self, texts: List[Document]) -> FAISS:
+        """
+        Create a new FAISS vectorstore using the index type from FAISS_INDEX_TYPE
+        
+        Supported types:
+            flat - exact IndexFlatL2 (default)
+            fp16 - IndexScalarQuantizer with FP16 codes (half the memory, near-exact)
+            pq   - IndexPQ with 16-dim sub-vectors (64x smaller, needs ~10k vectors to train)
+        
+        Only flat-code indexes are offered: LangChain's delete() renumbers ids
+        contiguously, which IVF indexes (explicit ids) do not.
+        """
+        index_type = os.getenv("FAISS_INDEX_TYPE", "flat").strip().lower()
+        if index_type not in ("fp16", "pq"):
+            return FAISS.from_documents(texts, self.embeddings)
+        
+        from langchain_community.docstore.in_memory import InMemoryDocstore
+        
+        contents = [doc.page_content for doc in texts]
+        vectors = np.asarray(self.embeddings.embed_documents(contents), dtype=np.float32)
+        ntotal, dimension = vectors.shape
+        
+        if index_type == "fp16":
+            index = faiss.IndexScalarQuantizer(dimension, faiss.ScalarQuantizer.QT_fp16)
+        elif ntotal < 39 * 256 or dimension % 16 != 0:
+            # FAISS wants ~39 training points per centroid for 256-entry PQ codebooks
+            print(f"⚠️ Cannot train PQ index on {ntotal} vectors, using flat index")
+            index = faiss.IndexFlatL2(dimension)
+        else:
+            index = faiss.IndexPQ(dimension, dimension // 16, 8)
+        
+        if not index.is_trained:
+            index.train(vectors)
+        
+        vectorstore = FAISS(
+            embedding_function=self.embeddings,
+            index=index,
+            docstore=InMemoryDocstore(),
+            index_to_docstore_id={}
+        )
+        vectorstore.add_embeddings(
+            zip(contents, vectors.tolist()),
+            metadatas=[doc.metadata for doc in texts]
+        )
+        print(f"🧮 Built {type(index).__name__} index with {index.ntotal} vectors")
+        return vectorstore
+    
     def _process_excel_file(self, file_path: str) -> List[Document]:
         """Process Excel file using LlamaParse with pandas fallback"""
         print(f"📊 Processing Excel file: {file_path}")
@@ -707,6 +1075,7 @@ class RAGSystem:
             try:
                 print(f"📊 Using Unstructured fallback for Excel processing: {file_path}")
                 
+                from langchain_community.document_loaders import UnstructuredFileLoader
                 loader = UnstructuredFileLoader(file_path)
                 documents = loader.load()
                 
@@ -756,6 +1125,7 @@ class RAGSystem:
             try:
                 print(f"📄 Using Unstructured fallback for PDF processing: {file_path}")
                 
+                from langchain_community.document_loaders import UnstructuredFileLoader
                 loader = UnstructuredFileLoader(file_path)
                 documents = loader.load()
                 
@@ -824,14 +1194,18 @@ class RAGSystem:
             # Sanitize query
             sanitized_question = self.sanitize_query(question)
             
-            # Check LRU cache first
-            cache_key = f"{sanitized_question}_{max_results}"
+            # Check LRU cache first (case-insensitive so trivially different
+            # spellings of the same question share one entry). Matching is exact
+            # rather than by embedding similarity: two different questions can
+            # score above a similarity threshold and would get each other's answer.
+            cache_key = f"{sanitized_question.lower()}_{max_results}"
             
             # Check LRU cache only for performance
             cached_result = self._get_from_lru_cache(cache_key)
             if cached_result:
-                cached_result["cached"] = True
-                return cached_result
+                # Return a copy so the stored entry keeps its original flags, with
+                # the caller's own spelling rather than the one that was cached
+                return {**cached_result, "question": sanitized_question, "cached": True}
             
             print(f"❓ Processing query: {sanitized_question[:100]}...")
             
@@ -915,7 +1289,16 @@ class RAGSystem:
             # Simple caching (LRU cache only, no fallback cache)
             self._set_in_lru_cache(cache_key, result_dict)
             
-            # Telemetry disabled for performance optimization
+            # The chain runs retrieval and generation in one call, timed as retrieval_time
+            self.record_metrics(RetrievalMetrics(
+                query_time=total_time,
+                retrieval_time=retrieval_time,
+                generation_time=0.0,
+                total_tokens=0,
+                source_count=len(sources),
+                relevance_score=relevance_score,
+                confidence_score=confidence_score
+            ))
 
             return result_dict
             
@@ -945,14 +1328,26 @@ class RAGSystem:
         
         # Use optimized retrieval with MMR for diversity
         retrieval_count = max_results if max_results else self.max_retrieval_results
-        retriever = vectorstore.as_retriever(
-            search_type="mmr",
-            search_kwargs={
-                "k": retrieval_count,
-                "fetch_k": max(40, retrieval_count * 5),
-                "lambda_mult": 0.5
-            }
-        )
+        fetch_count = max(40, retrieval_count * 5)
+        if self._batch_searcher:
+            gpu = self._gpu_index
+            retriever = BatchedMMRRetriever(
+                vectorstore=vectorstore,
+                searcher=self._batch_searcher,
+                search_index=gpu[1] if gpu and gpu[0] is vectorstore else None,
+                k=retrieval_count,
+                fetch_k=fetch_count,
+                lambda_mult=0.5
+            )
+        else:
+            retriever = vectorstore.as_retriever(
+                search_type="mmr",
+                search_kwargs={
+                    "k": retrieval_count,
+                    "fetch_k": fetch_count,
+                    "lambda_mult": 0.5
+                }
+            )
         
         # Simplified prompt for better performance
         from langchain.prompts import PromptTemplate
@@ -1014,6 +1409,7 @@ Answer:"""
         return {
             "status": "active",
             "total_vectors": vectorstore.index.ntotal,
+            "index_type": type(vectorstore.index).__name__,
             "index_size_mb": round(index_size_mb, 2)
         }
     
@@ -1023,11 +1419,15 @@ Answer:"""
         
         try:
             index_path = self.base_storage_dir / "faiss_index"
-            if index_path.exists():
-                shutil.rmtree(index_path)
-                print("✅ RAG system reset successfully")
-            else:
-                print("ℹ️ No existing index to reset")
+            with self.index_write_lock:
+                self._query_lru_cache.clear()
+                self._index_cache = None
+                self._gpu_index = None
+                if index_path.exists():
+                    shutil.rmtree(index_path)
+                    print("✅ RAG system reset successfully")
+                else:
+                    print("ℹ️ No existing index to reset")
         except Exception as e:
             print(f"❌ Failed to reset RAG system: {e}")
     
@@ -1068,8 +1468,7 @@ Answer:"""
     
     def _detect_language(self, query: str) -> str:
         """Detect query language"""
-        thai_pattern = re.compile(r'[\u0E00-\u0E7F]')
-        if thai_pattern.search(query):
+        if _THAI_CHAR_RE.search(query):
             return "thai"
         return "english"
     
@@ -1077,22 +1476,26 @@ Answer:"""
         """Extract important keywords from query"""
         if language == "thai":
             # For Thai, use a different approach - split by spaces and filter
-            stop_words = {"คือ", "อะไร", "อย่างไร", "ของ", "ใน", "ที่", "และ", "หรือ", "แต่", "กับ", "โดย", "มี", "เป็น", "จะ", "ได้", "ให้", "กับ", "จาก", "ถึง", "ที่", "นี้", "นั้น", "ไหน", "ใคร", "เมื่อ", "ทำไม", "อย่างไร", "เท่าไร", "กี่", "หลาย", "มาก", "น้อย", "ดี", "ไม่", "ใช่", "ใช่ไหม", "หรือไม่"}
-            
-            # Split by spaces and filter
             words = query.split()
             keywords = []
             for word in words:
                 # Clean the word
-                clean_word = re.sub(r'[^\u0E00-\u0E7F\u0E80-\u0EFFa-zA-Z0-9]', '', word)
-                if clean_word and len(clean_word) > 1 and clean_word not in stop_words:
+                clean_word = _THAI_WORD_CLEAN_RE.sub('', word)
+                if clean_word and len(clean_word) > 1 and clean_word not in _THAI_STOP_WORDS:
                     keywords.append(clean_word)
         else:
             # For English, use word boundaries
-            stop_words = {"what", "is", "the", "a", "an", "and", "or", "but", "in", "on", "at", "to", "for", "of", "with", "by", "are", "you", "your", "this", "that", "these", "those", "have", "has", "had", "do", "does", "did", "will", "would", "could", "should", "can", "may", "might", "must"}
-            
-            words = re.findall(r'\b[a-zA-Z]+\b', query.lower())
-            keywords = [word for word in words if word not in stop_words and len(word) > 2]
+            words = _ENGLISH_WORD_RE.findall(query.lower())
+            keywords = [word for word in words if word not in _ENGLISH_STOP_WORDS and len(word) > 2]
+        
+        keywords = list(dict.fromkeys(keywords))  # Drop repeats, keep first occurrence order
+        
+        # Rank by corpus IDF so terms that discriminate between chunks come first;
+        # terms the corpus never saw rank as rarest, and ties keep query order
+        keyword_idf = self._get_keyword_idf()
+        if keyword_idf:
+            idf, unseen_idf = keyword_idf
+            keywords.sort(key=lambda word: -idf.get(word.lower(), unseen_idf))
         
         # Limit to top 5 most relevant keywords
         return keywords[:5]
@@ -1192,10 +1595,7 @@ Answer:"""
     
     def _calculate_confidence(self, query: str, keywords: List[str]) -> float:
         """Calculate query confidence score"""
-        base_confidence = min(len(query) / 50, 1.0)
-        keyword_bonus = min(len(keywords) / 5, 0.3)
-        
-        return min(base_confidence + keyword_bonus, 1.0)
+        return _CONFIDENCE_TABLE[min(len(query), 50)][min(len(keywords), 2)]
     
     def _generate_suggestions(self, query: str, intent: str, language: str) -> List[str]:
         """Generate RM-specific query suggestions"""
@@ -1292,11 +1692,11 @@ Answer:"""
             errors.append("Query too long (maximum 1000 characters)")
         
         # Check for special characters (only malicious ones)
-        if re.search(r'[<>{}\[\]\\]', query):
+        if _INVALID_QUERY_CHARS_RE.search(query):
             errors.append("Query contains invalid special characters")
         
         # Check for excessive whitespace
-        if re.search(r'\s{5,}', query):  # Increased from 3 to 5
+        if _EXCESSIVE_WHITESPACE_RE.search(query):  # Increased from 3 to 5
             errors.append("Query contains excessive whitespace")
         
         # Relaxed repetitive word check - only flag if same word appears more than 8 times
@@ -1305,8 +1705,7 @@ Answer:"""
             word_counts = {}
             for word in words:
                 # Skip common words that naturally repeat (English and Thai)
-                if word in ['the', 'a', 'an', 'and', 'or', 'of', 'to', 'for', 'in', 'on', 'with', 'by', 'from', 'at', 'as', 'is', 'are', 'was', 'were', 'be', 'been', 'have', 'has', 'had', 'do', 'does', 'did', 'will', 'would', 'could', 'should', 'can', 'may', 'might', 'must',
-                           'ครับ', 'ค่ะ', 'คุณ', 'ของ', 'ที่', 'และ', 'หรือ', 'เป็น', 'ใน', 'กับ', 'จาก', 'ไป', 'มา', 'ได้', 'ให้', 'แล้ว', 'เพื่อ', 'ว่า', 'ก็', 'ไว้', 'อยู่', 'ซึ่ง', 'ไม่', 'มี', 'ประกัน']:
+                if word in _REPEATABLE_QUERY_WORDS:
                     continue
                 word_counts[word] = word_counts.get(word, 0) + 1
                 if word_counts[word] > 8:  # Increased threshold from 5 to 8
@@ -1317,8 +1716,8 @@ Answer:"""
     
     def sanitize_query(self, query: str) -> str:
         """Sanitize query for safe processing"""
-        query = re.sub(r'\s+', ' ', query.strip())
-        query = re.sub(r'[<>{}[\]\\]', '', query)
+        query = _WHITESPACE_RE.sub(' ', query.strip())
+        query = _INVALID_QUERY_CHARS_RE.sub('', query)
         return query
     
     def calculate_relevance_score(self, query: str, sources: List[Dict]) -> float:
@@ -1342,31 +1741,51 @@ Answer:"""
         
         return total_score / len(sources)
     
+    def record_metrics(self, metrics: RetrievalMetrics):
+        """Store one query's metrics in the ring buffer, overwriting the oldest row when full"""
+        with self._metrics_lock:
+            self._metrics[self._metrics_count % len(self._metrics)] = (
+                metrics.query_time,
+                metrics.retrieval_time,
+                metrics.generation_time,
+                metrics.total_tokens,
+                metrics.source_count,
+                metrics.relevance_score,
+                metrics.confidence_score
+            )
+            self._metrics_count += 1
+    
     def get_quality_metrics(self) -> Dict:
         """Get quality metrics for the system"""
-        if not self.performance_metrics:
-            return {"status": "no_data"}
-        
-        recent_metrics = self.performance_metrics[-10:]  # Last 10 queries
-        
-        avg_query_time = sum(m.query_time for m in recent_metrics) / len(recent_metrics)
-        avg_confidence = sum(m.confidence_score for m in recent_metrics) / len(recent_metrics)
-        avg_relevance = sum(m.relevance_score for m in recent_metrics) / len(recent_metrics)
+        with self._metrics_lock:
+            total_queries = self._metrics_count
+            if not total_queries:
+                return {"status": "no_data"}
+            
+            # Last 10 queries; fancy indexing copies the rows out of the ring
+            rows = np.arange(total_queries - min(total_queries, 10), total_queries) % len(self._metrics)
+            recent_metrics = self._metrics[rows]
         
         return {
-            "avg_query_time": round(avg_query_time, 3),
-            "avg_confidence": round(avg_confidence, 3),
-            "avg_relevance": round(avg_relevance, 3),
-            "total_queries": len(self.performance_metrics),
-            "cache_hit_rate": len(self._query_lru_cache) / max(len(self.performance_metrics), 1)
+            "avg_query_time": round(float(recent_metrics["query_time"].mean()), 3),
+            "avg_confidence": round(float(recent_metrics["confidence_score"].mean()), 3),
+            "avg_relevance": round(float(recent_metrics["relevance_score"].mean()), 3),
+            "total_queries": total_queries,
+            "cache_hit_rate": self._query_lru_cache.get_stats()["hit_rate"]
         }
     
     def get_cache_stats(self) -> Dict:
         """Get cache performance statistics"""
+        query_cache_stats = self._query_lru_cache.get_stats()
         return {
-            "lru_cache_size": len(self._query_lru_cache),
+            "lru_cache_size": query_cache_stats["size"],
             "lru_cache_max_size": self._max_cache_size,
-            "lru_cache_usage": len(self._query_lru_cache) / self._max_cache_size,
+            "lru_cache_usage": query_cache_stats["size"] / self._max_cache_size,
+            "lru_cache_ttl_seconds": query_cache_stats["ttl_seconds"],
+            "lru_cache_hits": query_cache_stats["hits"],
+            "lru_cache_misses": query_cache_stats["misses"],
+            "lru_cache_evictions": query_cache_stats["evictions"],
+            "lru_cache_hit_rate": round(query_cache_stats["hit_rate"], 3),
             "fallback_caches_available": len(self.cache_fallbacks)
         }
 
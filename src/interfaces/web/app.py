@@ -13,6 +13,21 @@ import re
 import traceback
 from werkzeug.utils import secure_filename
 from werkzeug.security import generate_password_hash, check_password_hash
+from flask.json.provider import DefaultJSONProvider
+
+# Import orjson with fallback (faster JSON encode/decode for API responses)
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+# Import google-re2 with fallback (linear-time DFA matching for keyword scans)
+try:
+    import re2
+    RE2_AVAILABLE = True
+except ImportError:
+    RE2_AVAILABLE = False
 
 import sys
 import os
@@ -40,7 +55,25 @@ PASSWORDS = {
     'admin': 'admin123'
 }
 
+class OrjsonProvider(DefaultJSONProvider):
+    """Flask JSON provider backed by orjson for jsonify() and request.get_json()"""
+
+    def dumps(self, obj, **kwargs):
+        # Sorted keys and passed-through datetimes keep Flask's response shape:
+        # self.default renders datetimes as HTTP dates like the default provider
+        return orjson.dumps(
+            obj,
+            default=self.default,
+            option=(orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+                    | orjson.OPT_SORT_KEYS | orjson.OPT_PASSTHROUGH_DATETIME)
+        ).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
 app = Flask(__name__)
+if ORJSON_AVAILABLE:
+    app.json = OrjsonProvider(app)
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
 app.config['SECRET_KEY'] = 'your-secret-key-change-in-production'  # Change this in production
 
@@ -539,11 +572,10 @@ def get_file_content():
                     'message': 'No index found'
                 }), 404
             
-            # Get all documents with this filename
-            docs = vectorstore.similarity_search("", k=1000)  # Get all docs
+            # Get all documents with this filename straight from the docstore
             file_chunks = []
             
-            for doc in docs:
+            for doc in vectorstore.docstore._dict.values():
                 if doc.metadata.get('filename') == filename:
                     file_chunks.append({
                         'content': doc.page_content,
@@ -642,23 +674,24 @@ def delete_file():
         if not rag_system:
             return jsonify({'status': 'error', 'message': 'RAG system not initialized'}), 500
 
-        vectorstore = rag_system.load_index()
-        if vectorstore is None:
-            return jsonify({'status': 'error', 'message': 'No index found'}), 404
+        with rag_system.index_write_lock:
+            vectorstore = rag_system.load_index(writable=True)
+            if vectorstore is None:
+                return jsonify({'status': 'error', 'message': 'No index found'}), 404
 
-        # Find docstore IDs matching the filename
-        ids_to_delete = [
-            doc_id for doc_id, doc in vectorstore.docstore._dict.items()
-            if getattr(doc, 'metadata', {}).get('filename') == filename
-        ]
+            # Find docstore IDs matching the filename
+            ids_to_delete = [
+                doc_id for doc_id, doc in vectorstore.docstore._dict.items()
+                if getattr(doc, 'metadata', {}).get('filename') == filename
+            ]
 
-        if not ids_to_delete:
-            return jsonify({'status': 'error', 'message': 'File not found in index'}), 404
+            if not ids_to_delete:
+                return jsonify({'status': 'error', 'message': 'File not found in index'}), 404
 
-        before = vectorstore.index.ntotal
-        vectorstore.delete(ids_to_delete)
-        rag_system.save_index(vectorstore)
-        after = vectorstore.index.ntotal
+            before = vectorstore.index.ntotal
+            vectorstore.delete(ids_to_delete)
+            rag_system.save_index(vectorstore)
+            after = vectorstore.index.ntotal
 
         # Remove from file monitor cache if present
         try:
@@ -1044,32 +1077,46 @@ def get_trainee_details(trainee_id):
         }), 500
 
 # Advanced Coaching and Simulation Helper Functions
+
+# Coaching type keyword tables, checked in priority order (first match wins).
+# Built once at import instead of on every detect_coaching_type() call.
+COACHING_TYPE_KEYWORDS = (
+    # Competitive analysis
+    ('competitive', ('competitor', 'vs', 'compare', 'competition', 'advantage', 'better than', 'why choose')),
+    # Objection handling
+    ('objection_handling', ('objection', 'concern', 'worry', 'doubt', 'expensive', 'too much', 'not sure', 'hesitant')),
+    # Communication/keyword requests
+    ('communication', ('keywords', 'phrases', 'language', 'words', 'say', 'communicate', 'explain')),
+    # Product knowledge requests
+    ('product_knowledge', ('product', 'benefit', 'feature', 'coverage', 'policy', 'plan')),
+    # Sales process questions
+    ('sales_process', ('close', 'sell', 'process', 'steps', 'approach', 'strategy')),
+)
+
+# One compiled alternation per coaching type, so each category is a single
+# C-level scan of the question rather than one substring check per keyword.
+# RE2 compiles the alternation to a DFA when available; stdlib re otherwise.
+_keyword_re = re2 if RE2_AVAILABLE else re
+COACHING_TYPE_PATTERNS = tuple(
+    (coaching_type, _keyword_re.compile('|'.join(map(re.escape, keywords))))
+    for coaching_type, keywords in COACHING_TYPE_KEYWORDS
+)
+
+# Words allowed to repeat freely when de-duplicating coaching questions
+PROMPT_REPEATABLE_WORDS = frozenset([
+    'the', 'and', 'or', 'a', 'an', 'to', 'for', 'of', 'in', 'on', 'with',
+    'our', 'we', 'i', 'you', 'my', 'me', 'is', 'are', 'insurance'
+])
+
 def detect_coaching_type(question):
     """Automatically detect the most appropriate coaching type based on question content"""
     question_lower = question.lower()
-    
-    # Check for competitive analysis keywords
-    if any(word in question_lower for word in ['competitor', 'vs', 'compare', 'competition', 'advantage', 'better than', 'why choose']):
-        return 'competitive'
-    
-    # Check for objection handling keywords
-    elif any(word in question_lower for word in ['objection', 'concern', 'worry', 'doubt', 'expensive', 'too much', 'not sure', 'hesitant']):
-        return 'objection_handling'
-    
-    # Check for communication/keyword requests
-    elif any(word in question_lower for word in ['keywords', 'phrases', 'language', 'words', 'say', 'communicate', 'explain']):
-        return 'communication'
-    
-    # Check for product knowledge requests
-    elif any(word in question_lower for word in ['product', 'benefit', 'feature', 'coverage', 'policy', 'plan']):
-        return 'product_knowledge'
-    
-    # Check for sales process questions
-    elif any(word in question_lower for word in ['close', 'sell', 'process', 'steps', 'approach', 'strategy']):
-        return 'sales_process'
-    
-    else:
-        return 'general'
+
+    for coaching_type, pattern in COACHING_TYPE_PATTERNS:
+        if pattern.search(question_lower):
+            return coaching_type
+
+    return 'general'
 
 def create_coaching_prompt(question, coaching_type, product, customer_type, context):
     """Create dynamic, context-aware prompts for coaching scenarios"""
@@ -1088,7 +1135,7 @@ def create_coaching_prompt(question, coaching_type, product, customer_type, cont
         seen_count[word_lower] = count + 1
         
         # Allow common words to repeat more, but limit others
-        if word_lower in ['the', 'and', 'or', 'a', 'an', 'to', 'for', 'of', 'in', 'on', 'with', 'our', 'we', 'i', 'you', 'my', 'me', 'is', 'are', 'insurance']:
+        if word_lower in PROMPT_REPEATABLE_WORDS:
             filtered_words.append(word)
         elif count <= 2:  # Limit other words to 2 occurrences
             filtered_words.append(word)
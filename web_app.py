@@ -6,12 +6,40 @@ Entry point for the web interface.
 """
 import sys
 import os
+import shutil
 
 # Add src to path
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'src'))
 
-from src.interfaces.web.app import app
+HOST = '0.0.0.0'
+PORT = 5500
+
+def __getattr__(name):
+    """Import the Flask app on first access so `gunicorn web_app:app` still resolves it (PEP 562)"""
+    if name == 'app':
+        from src.interfaces.web.app import app
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def run_production_server():
+    """Replace this process with gunicorn running threaded workers"""
+    # Each worker imports the app and starts its own file monitor, so more than
+    # one worker ingests every dropped file once per process; scale with threads
+    workers = os.getenv('WEB_CONCURRENCY', '1')
+    threads = os.getenv('WEB_THREADS', '8')
+    os.execvp('gunicorn', [
+        'gunicorn',
+        '-w', workers,
+        '-k', 'gthread',
+        '--threads', threads,
+        '-b', f'{HOST}:{PORT}',
+        '--chdir', os.path.dirname(os.path.abspath(__file__)),
+        'web_app:app'
+    ])
 
 if __name__ == "__main__":
     debug_mode = os.getenv('FLASK_ENV') == 'development'
-    app.run(debug=debug_mode, host='0.0.0.0', port=5500)
+    if not debug_mode and shutil.which('gunicorn'):
+        run_production_server()
+    from src.interfaces.web.app import app
+    app.run(debug=debug_mode, host=HOST, port=PORT)